@@ -49,6 +49,10 @@ def init( ):
     global RANDOM_SAMPLE_BATCHES
     RANDOM_SAMPLE_BATCHES = True
     
+    # worker processes used by the data loaders, only worth it if loading is i/o bound
+    global LOADER_WORKERS
+    LOADER_WORKERS = 0
+    
     # define the total number of iertations you want to train for
     global NUM_ITERS
     NUM_ITERS = 20
@@ -69,6 +73,14 @@ def init( ):
     global USE_DP
     USE_DP = False
     
+    # compression applied to the model updates sent back by the workers
+    global COMPRESSION
+    COMPRESSION = "int8"        # none, int8, topk
+    
+    # fraction of the update values sent by the workers when using topk compression
+    global TOPK_RATIO
+    TOPK_RATIO = 0.001
+    
     #-------------------------------------------------------------------------------------------#
     #                                                                                           #
     #   Define process related information to be used by the program.                           #
@@ -7,6 +7,7 @@ import torch
 import torch.nn as nn
 import torch.optim as optim
 from torch.utils.data import RandomSampler, SequentialSampler
+from torch.utils.data.dataloader import default_collate
 import numpy as np
 
 #-----------------------------------------------------------------------------------------------#
@@ -14,9 +15,19 @@ import numpy as np
 #   I M P O R T     L O C A L     L I B R A R I E S   /   F I L E S                             #
 #                                                                                               #
 #-----------------------------------------------------------------------------------------------#
-from utils.utils import model_flatten, model_unflatten, AverageMeter
+from utils.utils import model_flatten, model_unflatten, compress_update, COMPRESSION_METHODS, AverageMeter
 from modules.optim_creator import get_optimizer
 
+#***********************************************************************************************#
+#                                                                                               #
+#   description:                                                                                #
+#   collate function that returns the inputs already flattened for the training loop.           #
+#                                                                                               #
+#***********************************************************************************************#
+def flatten_collate(batch):
+    inputs, targets = default_collate(batch)
+    return inputs.view(inputs.size(0), -1), targets
+
 #***********************************************************************************************#
 #                                                                                               #
 #   description:                                                                                #
@@ -33,15 +44,27 @@ class TrainingManager:
         # dataloader and related information need to sample batches
         self.data_info = dict()
         
+        # flat buffer backing the parameters of the model being trained, the model
+        # parameters are bound once as views into it and reused across rounds
+        self.local_params = None
+        
+        # part of the model update not sent yet when using top-k compression
+        self._residual = None
+        
+        # objects resolved from the train configuration, cached between rounds
+        self._global_model = None
+        self._param_numels = None
+        self._compiled_model = None
+        self._criterion = None
+        self._optimizer = None
+        
     def add_dataset(self, dataset, key: str):
         """Add new dataset to the current federated worker object.
         Args:
             dataset: a new dataset instance to be added.
             key: a unique identifier for the new dataset.
         """
-        if key not in self.datasets:
-            self.datasets[key] = dataset
-        else:
+        if self.datasets.setdefault(key, dataset) is not dataset:
             raise ValueError(f"Key {key} already exists in Datasets")
     
     def remove_dataset(self, key: str):
@@ -58,9 +81,7 @@ class TrainingManager:
             model: a new model instance to be added.
             key: a unique identifier for the new model.
         """
-        if key not in self.models:
-            self.models[key] = model
-        else:
+        if self.models.setdefault(key, model) is not model:
             raise ValueError(f"Key {key} already exists in Models")
     
     def remove_model(self, key: str):
@@ -79,52 +100,107 @@ class TrainingManager:
     def get_global_model(self):
         """Extract the latest model parameters stored at the federated worker
         """
-        model_params = self.owner.get_obj(self.model_param_id).clone().detach()
-        model = self.models[self.model_id]
-        # unpack parameters into the locally stored model
-        model_unflatten(model, model_params)
-        return model
+        # copy the parameters into the flat buffer backing the locally stored model
+        self.local_params.copy_(self.owner.get_obj(self.model_param_id))
+        return self._global_model
+    
+    def get_compiled_model(self):
+        """Return the global model compiled for the training loop, batches have a fixed
+        size so static shapes are used. Falls back to the eager model on PyTorch releases
+        without torch.compile
+        """
+        if self._compiled_model is None:
+            if hasattr(torch, "compile"):
+                self._compiled_model = torch.compile(self._global_model, dynamic=False)
+            else:
+                self._compiled_model = self._global_model
+        
+        return self._compiled_model
     
     def get_criterion(self):
         """Decide which criterion is required and build it
         """
-        if self.criterion == "CrossEntropyLoss":
-            criterion = nn.CrossEntropyLoss()
+        if self._criterion is None:
+            if self.criterion == "CrossEntropyLoss":
+                self._criterion = nn.CrossEntropyLoss()
         
-        return criterion
+        return self._criterion
         
     def get_optimizer(self, model):
         """Decide which optimizer is required and build it
         """
-        return get_optimizer(model, optim_name=self.optimizer, lr=self.lr, dp=self.diff_privacy)
+        if self._optimizer is None:
+            self._optimizer = get_optimizer(model, optim_name=self.optimizer, lr=self.lr, dp=self.diff_privacy)
+        
+        return self._optimizer
         
-    def store_training_results(self, updated_model, losses):
+    def store_training_results(self, losses):
         """Store the training results as local objects
         """
         # register losses array as a local object
-        loss = torch.tensor([1,2,3])#losses)
+        loss = losses
         loss.id = self.result_losses_id #"loss"
         self.owner.register_obj(loss)
         
-        # register updated model as a local object
-        updated_params = model_flatten(updated_model)
+        # register updated model as a local object, the flat buffer backing
+        # the model parameters already holds the trained parameters
+        updated_params = self.local_params
         updated_params.id = self.result_params_id #"updated_params"
         self.owner.register_obj(updated_params)
         
-        # compute change and register it for consumption by the server
-        difference = updated_params - (self.owner.get_obj(self.model_param_id))
+        # compute change as a single op over the flat vectors and register it for consumption by the server
+        difference = torch.sub(updated_params, self.owner.get_obj(self.model_param_id))
+        
+        # error feedback: add whatever top-k compression held back in previous rounds
+        if self.compression == "topk" and self._residual is not None:
+            difference.add_(self._residual)
+        
+        # compress the change to reduce the size of the update sent over the wire
+        compressed, aux_data = compress_update(difference, method=self.compression, ratio=self.topk_ratio, numels=self._param_numels)
+        if self.compression == "topk":
+            # whatever was not sent (including half precision rounding) is kept as residual for the next round
+            difference[aux_data.long()] -= compressed.float()
+            self._residual = difference
+        difference = compressed
         difference.id = self.result_differ_id #"differnce"
         self.owner.register_obj(difference)
+        if aux_data is not None:
+            aux_data.id = self.result_aux_id #"aux"
+            self.owner.register_obj(aux_data)
 
     def setup_configurations(self, config_dict: dict):
         """Setup the train configurations sent from the server
         """
+        # reject unknown compression before it can get out of sync with the server
+        if config_dict["compression"] not in COMPRESSION_METHODS:
+            raise ValueError(f"Unknown compression method {config_dict['compression']}")
+        
+        # the server sends the configuration every round, only drop the cached
+        # model, criterion and optimizer if something they depend on changed,
+        # including the model registered under the key being replaced
+        if (self.models[config_dict["model_id"]] is not self._global_model
+                or any(getattr(self, key, None) != config_dict[key] 
+                       for key in ("model_id", "lr", "criterion", "optimizer", "diff_privacy"))):
+            self._global_model = self.models[config_dict["model_id"]]
+            # bind the model parameters as views into one contiguous buffer
+            self.local_params = model_flatten(self._global_model)
+            model_unflatten(self._global_model, self.local_params)
+            self._param_numels = [param.numel() for param in self._global_model.parameters()]
+            self._compiled_model = None
+            self._criterion = None
+            self._optimizer = None
+            self._residual = None
+        # the error feedback residual is only valid for the compression setup it was built with
+        if any(getattr(self, key, None) != config_dict[key] for key in ("compression", "topk_ratio")):
+            self._residual = None
+        
         self.lr = config_dict["lr"]
         self.plan_id = config_dict["plan_id"]
         self.model_id = config_dict["model_id"]
         self.model_param_id = config_dict["model_param_id"]
         self.batch_size = config_dict["batch_size"]
         self.random_sample = config_dict["random_sample"]
+        self.loader_workers = config_dict["loader_workers"]
         self.max_nr_batches = config_dict["max_nr_batches"]
         self.criterion = config_dict["criterion"]
         self.optimizer = config_dict["optimizer"]
@@ -132,17 +208,25 @@ class TrainingManager:
         self.result_losses_id = config_dict["result_losses_id"]
         self.result_params_id = config_dict["result_params_id"]
         self.result_differ_id = config_dict["result_differ_id"]
+        self.result_aux_id = config_dict["result_aux_id"]
+        self.compression = config_dict["compression"]
+        self.topk_ratio = config_dict["topk_ratio"]
     
-    def next_batches(self, dataset_key: str):
+    def next_batches(self, dataset_key: str, device: str = "cpu"):
         """Return next set of batches for training.
+        Args:
+            dataset_key: identifier of the local dataset to sample from.
+            device: device the batches will be trained on, used to decide on pinned memory.
         """
         # raise value error if dataset doesn't exist
         if dataset_key not in self.datasets:
             raise ValueError(f"Dataset {dataset_key} unknown.")
         
-        # check if there is a need to create a new dataloader
-        if dataset_key not in self.data_info:
-            self._create_data_loader(dataset_key=dataset_key)
+        # check if there is a need to create a new dataloader, either none exists yet
+        # or the loader settings sent with the configuration have changed since
+        loader_settings = (self.loader_workers, device.startswith("cuda"))
+        if dataset_key not in self.data_info or self.data_info[dataset_key][2] != loader_settings:
+            self._create_data_loader(dataset_key=dataset_key, device=device)
         
         batches = []
         # sample the required number of batch
@@ -160,7 +244,7 @@ class TrainingManager:
         # return the requested batches
         return batches
     
-    def _create_data_loader(self, dataset_key: str):
+    def _create_data_loader(self, dataset_key: str, device: str = "cpu"):
         """Helper function to create the dataloader as per our requirements
         """
         data_range = range(len(self.datasets[dataset_key]))
@@ -174,9 +258,11 @@ class TrainingManager:
             self.datasets[dataset_key],
             batch_size=self.batch_size,
             sampler=sampler,
-            num_workers=0,
+            num_workers=self.loader_workers,
+            pin_memory=device.startswith("cuda"),
             drop_last=True,
+            collate_fn=flatten_collate,
         )
 
-        # add it as a local object
-        self.data_info[dataset_key] = [data_loader, None]
+        # add it as a local object along with the settings it was built with
+        self.data_info[dataset_key] = [data_loader, None, (self.loader_workers, device.startswith("cuda"))]
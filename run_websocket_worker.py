@@ -3,6 +3,7 @@
 #   I M P O R T     G L O B A L     L I B R A R I E S                                           #
 #                                                                                               #
 #-----------------------------------------------------------------------------------------------#
+import os
 import argparse
 import torch
 import numpy as np
@@ -17,15 +18,29 @@ import syft as sy
 from workers import FederatedWorker
 from modules.worker_config import setup_worker_config
 
+#***********************************************************************************************#
+#                                                                                               #
+#   description:                                                                                #
+#   helper function to find the number of threads torch can use on the cores of this process.   #
+#                                                                                               #
+#***********************************************************************************************#
+def available_threads():
+    # torch defaults to one thread per physical core, also respect the cpu affinity if set
+    if hasattr(os, "sched_getaffinity"):
+        return min(torch.get_num_threads(), len(os.sched_getaffinity(0)))
+    return torch.get_num_threads()
+
 #***********************************************************************************************#
 #                                                                                               #
 #   description:                                                                                #
 #   starting websocket server for a given client / worker node. Each now worker has a server.   #
 #                                                                                               #
 #***********************************************************************************************#
-def start_websocket_worker(id, host, port, hook, rank, world_size):
+def start_websocket_worker(id, host, port, hook, rank, world_size, local_count=1):
+    # leave a core for the event loops and share the rest between the workers on this host
+    num_threads = max(1, (available_threads() - 1) // local_count)
     # create a server instance
-    worker = FederatedWorker(id=id, host=host, port=port, hook=hook, verbose=False)
+    worker = FederatedWorker(id=id, host=host, port=port, hook=hook, verbose=False, num_threads=num_threads)
     # setup worker configurations
     setup_worker_config(worker, rank, world_size)
     # print a log message, do remember to clean up though
@@ -48,10 +63,11 @@ if __name__ == "__main__":
     parser.add_argument("--id", type=str, help="name (id) of the websocket server worker, e.g. --id alice", required=True)
     parser.add_argument("--rank", type=int, help="rank of current worker process, used purely for dataset loading", required=True)
     parser.add_argument("--world", type=int, help="total number of worker processes, used purely for dataset loading", required=True)
+    parser.add_argument("--local", type=int, default=1, help="number of worker processes on this host, used to split the cpu threads")
     args = parser.parse_args()
     
     # hook and start server
     hook = sy.TorchHook(torch)
     
     # call server start function
-    worker = start_websocket_worker(id=args.id, host=args.host, port=args.port, hook=hook, rank=args.rank, world_size=args.world)
+    worker = start_websocket_worker(id=args.id, host=args.host, port=args.port, hook=hook, rank=args.rank, world_size=args.world, local_count=args.local)
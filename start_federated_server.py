@@ -27,7 +27,7 @@ from modules.model_loader import get_model
 from modules.data_loader import load_dataset
 from modules.validate import validate
 #from modules.training_plan import build_and_get_train_plan
-from utils.utils import average_model_parameters, model_flatten, model_unflatten
+from utils.utils import average_model_parameters, model_flatten, model_unflatten, decompress_update, COMPRESSION_METHODS
 from configs import globals as glb
 
 #-----------------------------------------------------------------------------------------------#
@@ -64,11 +64,12 @@ async def connection_handler(websocket, path):
 #   helper fucntions to communicate with client worker.                                         #
 #                                                                                               #
 #***********************************************************************************************#
-async def fit_model_on_worker(worker_ptr: FederatedWorkerPointer, model_params, train_plan, dataset_key, iteration, sampled_id, kwargs):
+async def fit_model_on_worker(worker_ptr: FederatedWorkerPointer, model_params, param_numels, train_plan, dataset_key, iteration, sampled_id, kwargs):
     """Send the model to the worker and fit the model on the worker's training data.
     Args:
         worker_ptr: Remote location, where the model shall be trained.
         model: Batch size of each training step.
+        param_numels: number of elements of each parameter tensor in model_params.
         train_plan: Model which shall be trained.
         iteration: current iteration being run
     Returns:
@@ -92,8 +93,14 @@ async def fit_model_on_worker(worker_ptr: FederatedWorkerPointer, model_params,
     await worker_ptr.set_train_config(**kwargs)
     
     # run the async fit method and fetch results
-    task_object = worker_ptr.async_fit(dataset_key=dataset_key, iteration=iteration, return_ids=[kwargs["result_losses_id"], kwargs["result_differ_id"]])
-    loss, worker_update = await task_object
+    return_ids = [kwargs["result_losses_id"], kwargs["result_differ_id"]]
+    if kwargs["compression"] != "none":
+        return_ids.append(kwargs["result_aux_id"])
+    task_object = worker_ptr.async_fit(dataset_key=dataset_key, iteration=iteration, return_ids=return_ids)
+    loss, worker_update, aux_data = await task_object
+    
+    # reconstruct the update in case the worker compressed it
+    worker_update = decompress_update(worker_update, aux_data, method=kwargs["compression"], numels=param_numels)
     
     # return results    
     return worker_ptr.id, loss, worker_update
@@ -113,15 +120,21 @@ def build_training_configurations():
     kwargs["lr"] = glb.INITIAL_LR
     kwargs["batch_size"] = glb.BATCH_SIZE
     kwargs["random_sample"] = glb.RANDOM_SAMPLE_BATCHES
+    kwargs["loader_workers"] = glb.LOADER_WORKERS
     kwargs["max_nr_batches"] = glb.MAX_NR_BATCHES
     kwargs["dataset_key"] = glb.DATASET_ID
     #kwargs["iterations"] = glb.NUM_ITERS
     kwargs["criterion"] = glb.CRITERION
     kwargs["optimizer"] = glb.OPTIMIZER
     kwargs["diff_privacy"] = glb.USE_DP
+    if glb.COMPRESSION not in COMPRESSION_METHODS:
+        raise ValueError(f"Unknown compression method {glb.COMPRESSION}")
+    kwargs["compression"] = glb.COMPRESSION
+    kwargs["topk_ratio"] = glb.TOPK_RATIO
     kwargs["result_params_id"] = "result_param"
     kwargs["result_differ_id"] = "result_diff"
     kwargs["result_losses_id"] = "result_loss"
+    kwargs["result_aux_id"] = "result_aux"
 
     return kwargs
 
@@ -167,6 +180,7 @@ async def training_handler():
         
         # extract latest model parameters
         model_params = model_flatten(model)
+        param_numels = [param.numel() for param in model.parameters()]
         
         # run the training on all workers
         start_timer_iter = timer()
@@ -175,6 +189,7 @@ async def training_handler():
                 fit_model_on_worker(
                     worker_ptr=worker,
                     model_params=model_params,
+                    param_numels=param_numels,
                     train_plan=train_plan,
                     dataset_key=glb.DATASET_ID,
                     iteration=curr_iter,
@@ -80,7 +80,8 @@ def start_federated_workers(worker_list, world):
                         "--port", "{0}".format(worker[1]),
                         "--id", "{0}".format(worker[2]),
                         "--rank", "{0}".format(worker[3]),
-                        "--world", "{0}".format(world)]
+                        "--world", "{0}".format(world),
+                        "--local", "{0}".format(len(worker_list))]
         # run and keep track of worker processes
         PROCESS_LIST.append(subprocess.Popen(process_call))
     # start the server for new client
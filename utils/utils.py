@@ -21,7 +21,7 @@ def model_flatten(model):
 def model_unflatten(model, vec):
     pointer = 0
     for param in model.parameters():
-        num_param = torch.prod(torch.LongTensor(list(param.size())))
+        num_param = param.numel()
         param.data = vec[pointer:pointer + num_param].view(param.size())
         pointer += num_param
 
@@ -40,7 +40,7 @@ def model_grad_flatten(model):
 def model_grad_unflatten(model, vec):
     pointer = 0
     for param in model.parameters():
-        num_param = torch.prod(torch.LongTensor(list(param.size())))
+        num_param = param.numel()
         param.grad = vec[pointer:pointer + num_param].view(param.size())
         pointer += num_param
         
@@ -142,3 +142,58 @@ def average_model_parameters(model_params: dict):
     
     # returnt the averaged model
     return avg_model
+
+#***********************************************************************************************#
+#                                                                                               #
+#   Description:                                                                                #
+#   utility functions to compress / decompress model updates sent to the server.                #
+#                                                                                               #
+#***********************************************************************************************#
+COMPRESSION_METHODS = ("none", "int8", "topk")
+
+def compress_update(update, method: str = "none", ratio: float = 0.001, numels: list = None):
+    """Compress a flat model update before it is sent to the server.
+    Args:
+        update: flat tensor holding the model update.
+        method: compression to apply, one of "none", "int8" or "topk".
+        ratio: fraction of the largest (by magnitude) values kept by "topk".
+        numels: number of elements of each parameter tensor in the flat update, 
+            required by "int8" which uses one scale per parameter tensor.
+    Returns:
+        A tuple of the compressed update and the auxiliary data needed to 
+        decompress it (None if no auxiliary data is required).
+    """
+    if method == "int8":
+        # per-tensor symmetric quantization with one float scale for each parameter tensor
+        scales = torch.stack([chunk.abs().max() for chunk in update.split(numels)]).clamp(min=1e-12) / 127.0
+        quantized = torch.round(update / scales.repeat_interleave(torch.tensor(numels))).to(torch.int8)
+        return quantized, scales
+    elif method == "topk":
+        # keep only the largest values as half precision, along with their positions
+        k = max(1, int(ratio * update.numel()))
+        _, indices = torch.topk(update.abs(), k)
+        return update[indices].half(), indices.int()
+    elif method == "none":
+        return update, None
+    raise ValueError(f"Unknown compression method {method}")
+
+def decompress_update(update, aux_data, method: str = "none", numels: list = None):
+    """Reconstruct a flat model update created by compress_update.
+    Args:
+        update: the compressed update.
+        aux_data: auxiliary data returned alongside the compressed update.
+        method: compression that was applied, one of "none", "int8" or "topk".
+        numels: number of elements of each parameter tensor in the dense update, 
+            required by "int8" and "topk".
+    Returns:
+        The flat float tensor holding the model update.
+    """
+    if method == "int8":
+        return update.float() * aux_data.repeat_interleave(torch.tensor(numels))
+    elif method == "topk":
+        dense = torch.zeros(sum(numels))
+        dense[aux_data.long()] = update.float()
+        return dense
+    elif method == "none":
+        return update
+    raise ValueError(f"Unknown compression method {method}")
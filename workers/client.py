@@ -3,15 +3,29 @@
 #   I M P O R T     G L O B A L     L I B R A R I E S                                           #
 #                                                                                               #
 #-----------------------------------------------------------------------------------------------#
+import os
+import ssl
+import asyncio
+import logging
 import torch
 import syft as sy
+import websockets
 from timeit import default_timer as timer
+from concurrent.futures import ThreadPoolExecutor
 
 from typing import Union
 from typing import List
 
 from syft.workers.websocket_server import WebsocketServerWorker
 from syft.generic.abstract.tensor import AbstractTensor
+from syft.exceptions import GetNotPermittedError
+from syft.exceptions import ResponseSignatureError
+
+# use the faster uvloop event loop whenever it is available
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 #-----------------------------------------------------------------------------------------------#
 #                                                                                               #
@@ -41,6 +55,7 @@ class FederatedWorker(WebsocketServerWorker):
         key_path: str = None,
         datasets = None,
         models = None,
+        num_threads: int = None,
     ):
         """This is a simple extension to normal workers wherein
         all messages are passed over websockets. Note that because
@@ -61,10 +76,36 @@ class FederatedWorker(WebsocketServerWorker):
                 yourself
             cert_path: path to used secure certificate, only needed for secure connections
             key_path: path to secure key, only needed for secure connections
+            num_threads: intra-op threads torch may use for training, leave as None
+                to keep torch's default
         """
         
         # create a train manager instance
         self.train_manager = TrainingManager(self, datasets, models)
+        
+        # limit torch threads so the workers sharing this host do not oversubscribe it
+        if num_threads is not None:
+            try:
+                torch.set_num_interop_threads(min(2, num_threads))
+            except RuntimeError:
+                # can only be set once and before any inter-op parallel work has started
+                pass
+        
+        # thread pool used to process messages off the event loop, the intra-op thread
+        # count is kept per thread by torch so it is set in every pool thread that trains
+        self._executor = ThreadPoolExecutor(
+            max_workers=os.cpu_count(),
+            initializer=torch.set_num_threads if num_threads is not None else None,
+            initargs=(num_threads,) if num_threads is not None else (),
+        )
+        
+        # serialized form of errors that carry no payload, keyed by type
+        self._serialized_errors = dict()
+        
+        # create the event loop up front and make it the current one
+        if loop is None:
+            loop = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
 
         # call WebsocketServerWorker constructor
         super().__init__(hook=hook, 
@@ -88,6 +129,65 @@ class FederatedWorker(WebsocketServerWorker):
         self.train_manager.setup_configurations(kwargs)
         return "SUCCESS"
 
+    def _recv_msg(self, message: bin) -> bin:
+        """Process a serialized message and return the serialized response. Errors
+        that carry no payload are serialized once per type and cached, the cached
+        copy is serialized without its traceback so that no stale remote traceback
+        of an earlier occurrence is sent to later clients.
+        Args:
+            message: the serialized message received from the client.
+        """
+        try:
+            return self.recv_msg(message)
+        except (ResponseSignatureError, GetNotPermittedError) as e:
+            if e.args or getattr(e, "ids_generated", None) is not None:
+                return sy.serde.serialize(e)
+            if type(e) not in self._serialized_errors:
+                self._serialized_errors[type(e)] = sy.serde.serialize(e.with_traceback(None))
+            return self._serialized_errors[type(e)]
+
+    async def _handler(self, websocket: websockets.WebSocketCommonProtocol, *unused_args):
+        """Websocket handler that listens to incoming connections. Messages are
+        processed strictly in order, one response per request, in the thread pool
+        so that the event loop keeps serving other connections during
+        (de)serialization and training.
+        Args:
+            websocket: the connection object of the new client.
+        """
+        try:
+            async for message in websocket:
+                response = await self.loop.run_in_executor(self._executor, self._recv_msg, message)
+                await websocket.send(response)
+        except websockets.exceptions.ConnectionClosed:
+            return
+
+    def start(self):
+        """Start the server on the worker's own event loop.
+        """
+        # secure behavior: adds a secure layer applying cryptography and authentication
+        ssl_context = None
+        if self.cert_path is not None and self.key_path is not None:
+            ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            ssl_context.load_cert_chain(self.cert_path, self.key_path)
+        # create the websocket server, payloads are serialized binary so skip per-message deflate
+        start_server = websockets.serve(
+            self._handler,
+            self.host,
+            self.port,
+            ssl=ssl_context,
+            max_size=None,
+            ping_timeout=None,
+            close_timeout=None,
+            compression=None,
+        )
+        # run the server forever
+        self.loop.run_until_complete(start_server)
+        print("Serving. Press CTRL-C to stop.")
+        try:
+            self.loop.run_forever()
+        except KeyboardInterrupt:
+            logging.info("Websocket server stopped.")
+
     def fit(self, dataset_key: str, iteration: int, device: str = "cpu", **kwargs):
         """Fits a model on the local dataset as specified in the local TrainConfig object.
         Args:
@@ -105,21 +205,21 @@ class FederatedWorker(WebsocketServerWorker):
         # get model and it's respective parameters
         model = self.train_manager.get_global_model()
         
-        # get criterion and optimizer instances
+        # get the compiled forward pass, criterion and optimizer instances
+        forward = self.train_manager.get_compiled_model()
         criterion = self.train_manager.get_criterion()
         optimizer = self.train_manager.get_optimizer(model)
         
         # get next set of batches to train on
-        data_batches = self.train_manager.next_batches(dataset_key=dataset_key)
+        data_batches = self.train_manager.next_batches(dataset_key=dataset_key, device=device)
         
-        # local variables for training
-        losses = []
+        # local variables for training, kept as a tensor to avoid a sync per batch
+        losses = torch.empty(len(data_batches))
         
         # starting training on all batches (need to modify this later to sample)
         for batch_idx, (input, target) in enumerate(data_batches):
-            input = input.view(self.train_manager.batch_size, -1)
             # compute output
-            output = model(input)
+            output = forward(input)
             # clear any previous buffers
             optimizer.zero_grad()
             # compute gradients in a backward pass
@@ -128,7 +228,7 @@ class FederatedWorker(WebsocketServerWorker):
             # call step of optimizer to update model params
             optimizer.step()
             # update local stores
-            losses.append(loss)
+            losses[batch_idx] = loss.detach()
         
         # note the end time of the iteration
         end_fit_time = timer()
@@ -137,6 +237,6 @@ class FederatedWorker(WebsocketServerWorker):
         print(f'Time to train 1 iteration on worker {self.id}: {(end_fit_time-start_fit_time):3f}s')
         
         # store all the results so that they can requested back by the server
-        self.train_manager.store_training_results(model, losses)
+        self.train_manager.store_training_results(losses)
         
         return None
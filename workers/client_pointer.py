@@ -6,7 +6,6 @@
 import torch
 import syft as sy
 
-import binascii
 from typing import Union
 from typing import List
 
@@ -61,6 +60,14 @@ class FederatedWorkerPointer(WebsocketClientWorker):
             timeout=timeout,
         )
 
+    def _forward_to_websocket_server_worker(self, message: bin) -> bin:
+        """Send the serialized message as a binary frame and return the
+        raw bytes of the response frame.
+        """
+        self.ws.send_binary(message)
+        response = self.ws.recv()
+        return response
+
     async def set_train_config(self, **kwargs):
         """Call the set_train_config() method on the remote worker (FederatedWorker instance).
         Args:
@@ -77,9 +84,10 @@ class FederatedWorkerPointer(WebsocketClientWorker):
         """Asynchronous call to fit function on the remote location.
         Args:
             dataset_key: Identifier of the dataset which shall be used for the training.
-            return_ids: List of return ids.
+            return_ids: List of return ids, the optional third id refers to the auxiliary
+                data (e.g. quantization scale) needed to decompress the update.
         Returns:
-            See return value of the FederatedWorker.fit() method.
+            A tuple of loss, (possibly compressed) update and auxiliary data (None if not requested).
         """
         if return_ids is None:
             return_ids = [sy.ID_PROVIDER.pop()]
@@ -87,13 +95,13 @@ class FederatedWorkerPointer(WebsocketClientWorker):
         # Close the existing websocket connection in order to open a asynchronous connection
         # This code is not tested with secure connections (wss protocol).
         self.close()
-        async with websockets.connect(self.url, timeout=self.timeout, max_size=None, ping_timeout=self.timeout) as websocket:
+        async with websockets.connect(self.url, timeout=self.timeout, max_size=None, ping_timeout=self.timeout, compression=None) as websocket:
             message = self.create_worker_command_message(
                 command_name="fit", return_ids=return_ids, dataset_key=dataset_key, iteration=iteration, device=device
             )
             # Send the message and return the deserialized response.
             serialized_message = sy.serde.serialize(message)
-            await websocket.send(str(binascii.hexlify(serialized_message)))
+            await websocket.send(serialized_message)
             await websocket.recv()  # returned value will be None, so don't care
 
         # Reopen the standard connection
@@ -108,8 +116,15 @@ class FederatedWorkerPointer(WebsocketClientWorker):
         serialized_message = sy.serde.serialize(msg)
         updated_params = self._send_msg(serialized_message)
         
+        # retrieve the auxiliary data of a compressed update if requested
+        aux_data = None
+        if len(return_ids) > 2:
+            msg = ObjectRequestMessage(return_ids[2], None, "")
+            serialized_message = sy.serde.serialize(msg)
+            aux_data = sy.serde.deserialize(self._send_msg(serialized_message))
+        
         # Return the deserialized response.
-        return sy.serde.deserialize(loss), sy.serde.deserialize(updated_params)
+        return sy.serde.deserialize(loss), sy.serde.deserialize(updated_params), aux_data
 
 
 